@@ -1,10 +1,24 @@
 import os
-import json
+
+# Set before torch/faiss are imported so both use every core instead of
+# inheriting a single-threaded default. A non-empty OMP_NUM_THREADS from the
+# environment is left to OpenMP as-is (it may be a nested spec like "4,2").
+omp_threads = None
+if not os.environ.get("OMP_NUM_THREADS"):
+    omp_threads = os.cpu_count() or 4
+    os.environ["OMP_NUM_THREADS"] = str(omp_threads)
+
+import re
+import asyncio
+from functools import lru_cache
+import faiss
+import numpy as np
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import HuggingFaceEmbeddings
+import torch
 
 
 # LOAD ENVIRONMENT VARIABLES
@@ -32,8 +46,16 @@ llm = ChatGroq(
 # LOAD FAISS VECTOR STORE
 
 
+# GPU with large batches when available, otherwise smaller CPU batches
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
 embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
+    model_name="sentence-transformers/all-MiniLM-L6-v2",
+    model_kwargs={"device": device},
+    encode_kwargs={
+        "batch_size": 256 if device == "cuda" else 64,
+        "normalize_embeddings": True
+    }
 )
 
 vectorstore = FAISS.load_local(
@@ -42,6 +64,22 @@ vectorstore = FAISS.load_local(
     allow_dangerous_deserialization=True
 )
 
+if omp_threads is not None:
+    faiss.omp_set_num_threads(omp_threads)
+
+DEPTS = ("HR", "Engineering", "Sales", "Finance", "Support")
+
+
+# Query embeddings are cached by normalized text. MiniLM is uncased, so
+# lowercasing does not change the vector.
+@lru_cache(maxsize=4096)
+def _embed(normalized_query):
+    return tuple(embeddings.embed_query(normalized_query))
+
+
+def embed_query(user_query):
+    return list(_embed(user_query.strip().lower()))
+
 
 print("FAISS index loaded successfully.")
 
@@ -50,6 +88,33 @@ print("FAISS index loaded successfully.")
 # ROUTER LAYER
 
 
+# Local similarity router: query vs. department descriptions, no LLM call
+DEPT_DESCRIPTIONS = {
+    "HR": "Hiring, Leave policy, Payroll, Employee benefits, Internal policies",
+    "Engineering": "System architecture, Deployment, APIs, Technical stack, Infrastructure",
+    "Sales": "Pricing plans, Product packages, Enterprise proposals, Discounts",
+    "Finance": "Invoice process, Payment terms, Billing, Refund policy",
+    "Support": "Login issues, Account recovery, Ticket process, Customer complaints",
+}
+
+DEPT_VECS = np.array(
+    embeddings.embed_documents([DEPT_DESCRIPTIONS[dept] for dept in DEPTS]),
+    dtype="float32"
+)
+DEPT_VECS /= np.linalg.norm(DEPT_VECS, axis=1, keepdims=True)
+
+ROUTE_THRESHOLD = 0.35
+
+# Quoted department names in the LLM router output
+_DEPT_RE = re.compile(rf'"({"|".join(DEPTS)})"')
+
+
+def route_by_similarity(query_vector):
+    query = np.array(query_vector, dtype="float32")
+    sims = DEPT_VECS @ (query / np.linalg.norm(query))
+    return [dept for dept, score in zip(DEPTS, sims) if score > ROUTE_THRESHOLD]
+
+
 router_prompt = ChatPromptTemplate.from_template("""
 You are an internal routing system for NovaTech Solutions Pvt. Ltd.
 
@@ -107,64 +172,124 @@ router_chain = router_prompt | llm
 
 
 def route_query(user_query):
+    departments = route_by_similarity(embed_query(user_query))
+    if departments:
+        return departments
+
+    # No clear match: fall back to the LLM router
     response = router_chain.invoke({"query": user_query})
-    raw_output = response.content.strip()
+    raw_output = response.content
 
-    try:
-        parsed = json.loads(raw_output)
-        return parsed.get("departments", [])
-    except json.JSONDecodeError:
-        return []
+    # Pick out known department names; tolerates markdown or trailing text
+    found = _DEPT_RE.findall(raw_output)
+    return list(dict.fromkeys(found))
 
 
 
 # RAG EXECUTION PER DEPARTMENT
 
 
-def execute_departments(departments, user_query):
-    responses = []
+NOT_AVAILABLE = "The requested information is not available in company records."
 
-    for dept in departments:
-
-        retriever = vectorstore.as_retriever(
-    search_kwargs={
-        "k": 4,
-        "filter": {"department": dept}
-    }
-)
 
+# Static prompt prefixes, built once; only context and query change per call
 
-        
+RAG_PREFIX = {
+    dept: f"""
+You are the {dept} Department of NovaTech Solutions Pvt. Ltd.
 
-        retrieved_docs = retriever.invoke(user_query)
+Use ONLY the company policy information below to answer.
 
-        if not retrieved_docs:
-            responses.append(
-                "The requested information is not available in company records."
-            )
-            continue
+If the answer is not present in the provided context, say:
+"The requested information is not available in company records."
 
-        context = "\n\n".join([doc.page_content for doc in retrieved_docs])
+Company Policy Information:
+"""
+    for dept in DEPTS
+}
 
-        rag_prompt = f"""
-You are the {dept} Department of NovaTech Solutions Pvt. Ltd.
+FALLBACK_PREFIX = """
+You are a senior manager at NovaTech Solutions Pvt. Ltd.
 
 Use ONLY the company policy information below to answer.
+Give ONE clear, professional, and structured answer.
 
 If the answer is not present in the provided context, say:
 "The requested information is not available in company records."
 
 Company Policy Information:
-{context}
-
-User Query:
-{user_query}
 """
 
-        result = llm.invoke(rag_prompt)
-        responses.append(result.content.strip())
+RAG_SUFFIX_FMT = "\n\nUser Query:\n{q}\n"
+
+
+# Drop chunks whose text was already retrieved, keeping rank order
 
-    return responses
+def unique_docs(docs):
+    seen = set()
+    unique = []
+    for doc in docs:
+        if doc.page_content not in seen:
+            seen.add(doc.page_content)
+            unique.append(doc)
+    return unique
+
+
+async def execute_departments(departments, user_query):
+    departments = list(dict.fromkeys(departments))
+
+    # Embed the query once and reuse the vector for every department search
+    query_vector = await asyncio.to_thread(embed_query, user_query)
+
+    async def run_one(dept):
+
+        retrieved_docs = unique_docs(await vectorstore.asimilarity_search_by_vector(
+            query_vector,
+            k=4,
+            filter={"department": dept}
+        ))
+
+        if not retrieved_docs:
+            return NOT_AVAILABLE
+
+        context = "\n\n".join([doc.page_content for doc in retrieved_docs])
+
+        rag_prompt = "".join([
+            RAG_PREFIX[dept], context, RAG_SUFFIX_FMT.format(q=user_query)
+        ])
+
+        result = await llm.ainvoke(rag_prompt)
+        return result.content.strip()
+
+    # Run all departments concurrently
+    tasks = [run_one(dept) for dept in departments]
+    responses = await asyncio.gather(*tasks)
+
+    return list(responses)
+
+
+# Router fallback: one retrieval over the whole index, one LLM call
+
+async def execute_all_departments(user_query):
+
+    query_vector = await asyncio.to_thread(embed_query, user_query)
+
+    retrieved_docs = unique_docs(await vectorstore.asimilarity_search_by_vector(
+        query_vector,
+        k=12
+    ))
+
+    if not retrieved_docs:
+        return NOT_AVAILABLE
+
+    context = "\n\n".join([doc.page_content for doc in retrieved_docs])
+
+    rag_prompt = "".join([
+        FALLBACK_PREFIX, context, RAG_SUFFIX_FMT.format(q=user_query)
+    ])
+
+    result = await llm.ainvoke(rag_prompt)
+    return result.content.strip()
 
 
 
@@ -191,11 +316,26 @@ Responses:
 merge_chain = merge_prompt | llm
 
 
+# Drop "not available" answers so they never need merging
+
+def useful_responses(responses):
+    return [r for r in responses if r.strip('"') != NOT_AVAILABLE]
+
+
+# Cap each response's length to keep the merge prompt small
+
+MERGE_RESPONSE_CHARS = 1500
+
+
+def merge_input(responses):
+    return {"responses": "\n\n".join(r[:MERGE_RESPONSE_CHARS] for r in responses)}
+
+
 
 # MAIN LOOP
 
 
-if __name__ == "__main__":
+async def main():
     while True:
         user_input = input("\nEnter query (type 'exit' to stop): ")
 
@@ -207,21 +347,25 @@ if __name__ == "__main__":
 
         # Router fallback (search all if unclear)
         if not departments:
-            departments = ["HR", "Engineering", "Sales", "Finance", "Support"]
+            print("\nFinal Response:\n")
+            print(await execute_all_departments(user_input))
+            continue
 
         # Step 2: Department RAG Execution
-        responses = execute_departments(departments, user_input)
+        responses = await execute_departments(departments, user_input)
 
-        # Step 3: Merge if Multiple Departments
-        if len(responses) > 1:
-            merged_response = merge_chain.invoke({
-                "responses": "\n\n".join(responses)
-            })
+        # Step 3: Merge only if more than one department had an answer
+        useful = useful_responses(responses)
+
+        if len(useful) > 1:
+            merged_response = await merge_chain.ainvoke(merge_input(useful))
             print("\nFinal Response:\n")
             print(merged_response.content.strip())
         else:
             print("\nFinal Response:\n")
-            print(responses[0])
+            print(useful[0] if useful else NOT_AVAILABLE)
 
 
-            
\ No newline at end of file
+if __name__ == "__main__":
+    # One event loop for the whole session so the async Groq client is reused
+    asyncio.run(main())
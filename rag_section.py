@@ -1,14 +1,15 @@
 import re
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
+import torch
 
 # -----------------------------
 # LOAD PDF
 # -----------------------------
 
-loader = PyPDFLoader("data/NovaTech_Corporate_policy.pdf")
+loader = PyMuPDFLoader("data/NovaTech_Corporate_policy.pdf")
 documents = loader.load()
 
 print(f"Loaded {len(documents)} pages from PDF.")
@@ -21,6 +22,13 @@ full_text = "\n".join([doc.page_content for doc in documents])
 
 sections = re.split(r"\n\d+\.\s", full_text)
 
+# Keywords per department, checked in priority order
+DEPARTMENT_KEYWORDS = (
+    ("HR", ("leave", "recruit")),
+    ("Sales", ("pricing", "plan")),
+    ("Finance", ("invoice", "payment")),
+)
+
 docs = []
 
 for section in sections:
@@ -28,15 +36,16 @@ for section in sections:
     if len(text) < 50:
         continue
 
-    # Detect department based on keywords
-    if "leave" in text.lower() or "recruit" in text.lower():
-        department = "HR"
-    elif "pricing" in text.lower() or "plan" in text.lower():
-        department = "Sales"
-    elif "invoice" in text.lower() or "payment" in text.lower():
-        department = "Finance"
-    else:
-        department = "General"
+    # Detect department based on keywords (lowercase once, first match in
+    # priority order wins)
+    text_lower = text.lower()
+    department = next(
+        (
+            dept for dept, keywords in DEPARTMENT_KEYWORDS
+            if any(kw in text_lower for kw in keywords)
+        ),
+        "General"
+    )
 
     docs.append(
         Document(
@@ -51,8 +60,16 @@ print(f"Split into {len(docs)} section chunks with metadata.")
 # EMBEDDINGS
 # -----------------------------
 
+# GPU with large batches when available, otherwise smaller CPU batches
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
 embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
+    model_name="sentence-transformers/all-MiniLM-L6-v2",
+    model_kwargs={"device": device},
+    encode_kwargs={
+        "batch_size": 256 if device == "cuda" else 64,
+        "normalize_embeddings": True
+    }
 )
 
 vectorstore = FAISS.from_documents(docs, embeddings)
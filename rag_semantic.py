@@ -1,14 +1,15 @@
 import os
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_experimental.text_splitter import SemanticChunker
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+import torch
 
 # -----------------------------
 # LOAD PDF
 # -----------------------------
 
-loader = PyPDFLoader("data/NovaTech_Corporate_policy.pdf")
+loader = PyMuPDFLoader("data/NovaTech_Corporate_policy.pdf")
 documents = loader.load()
 
 print(f"Loaded {len(documents)} pages from PDF.")
@@ -17,8 +18,16 @@ print(f"Loaded {len(documents)} pages from PDF.")
 # EMBEDDINGS MODEL
 # -----------------------------
 
+# GPU with large batches when available, otherwise smaller CPU batches
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
 embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
+    model_name="sentence-transformers/all-MiniLM-L6-v2",
+    model_kwargs={"device": device},
+    encode_kwargs={
+        "batch_size": 256 if device == "cuda" else 64,
+        "normalize_embeddings": True
+    }
 )
 
 # -----------------------------
@@ -1,16 +1,26 @@
 import re
-from langchain_community.document_loaders import PyPDFLoader
+import faiss
+from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
+import torch
 
-loader = PyPDFLoader("data/NovaTech_Corporate_policy.pdf")
+loader = PyMuPDFLoader("data/NovaTech_Corporate_policy.pdf")
 documents = loader.load()
 
 full_text = "\n".join([doc.page_content for doc in documents])
 
 sections = re.split(r"\n\d+\.\s", full_text)
 
+# Keywords per department, checked in priority order
+DEPARTMENT_KEYWORDS = (
+    ("HR", ("leave", "recruit")),
+    ("Sales", ("pricing", "plan")),
+    ("Finance", ("invoice", "payment")),
+    ("Support", ("login", "ticket")),
+)
+
 docs = []
 
 for section in sections:
@@ -18,18 +28,16 @@ for section in sections:
     if len(text) < 50:
         continue
 
+    # Lowercase once, then C-level substring checks in priority order;
+    # stops at the first department that matches
     text_lower = text.lower()
-
-    if "leave" in text_lower or "recruit" in text_lower:
-        department = "HR"
-    elif "pricing" in text_lower or "plan" in text_lower:
-        department = "Sales"
-    elif "invoice" in text_lower or "payment" in text_lower:
-        department = "Finance"
-    elif "login" in text_lower or "ticket" in text_lower:
-        department = "Support"
-    else:
-        department = "Engineering"
+    department = next(
+        (
+            dept for dept, keywords in DEPARTMENT_KEYWORDS
+            if any(kw in text_lower for kw in keywords)
+        ),
+        "Engineering"
+    )
 
     docs.append(
         Document(
@@ -38,11 +46,32 @@ for section in sections:
         )
     )
 
+# GPU with large batches when available, otherwise smaller CPU batches
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
 embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
+    model_name="sentence-transformers/all-MiniLM-L6-v2",
+    model_kwargs={"device": device},
+    encode_kwargs={
+        "batch_size": 256 if device == "cuda" else 64,
+        "normalize_embeddings": True
+    }
 )
 
 vectorstore = FAISS.from_documents(docs, embeddings)
+
+# Swap the flat index for HNSW (graph search instead of a full scan) with
+# int8 scalar-quantized storage (4x smaller than FP32 vectors).
+# Vectors are re-added in the same order, so docstore ids still line up.
+flat_index = vectorstore.index
+vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+
+hnsw_index = faiss.IndexHNSWSQ(flat_index.d, faiss.ScalarQuantizer.QT_8bit, 32)
+hnsw_index.hnsw.efSearch = 64
+hnsw_index.train(vectors)
+hnsw_index.add(vectors)
+
+vectorstore.index = hnsw_index
 vectorstore.save_local("faiss_metadata")
 
 print("Final metadata-based FAISS index created successfully.")